@@ -2,14 +2,23 @@ from __future__ import annotations
 
 """Agent logic for checking cheatsheet coverage.
 
-This module currently contains a minimal stub that wires together
-converted Markdown contents. The detailed LLM prompts for extracting
-topics and checking coverage can be filled in later.
+This module wires together converted Markdown contents and runs an
+embedding-similarity coverage pass over them. The detailed LLM prompts
+for extracting topics and checking coverage can be filled in later.
 """
 
+import hashlib
+import io
+import os
+import tempfile
+from collections.abc import Iterable, Sized
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable
+
+import numpy as np
+
+from file_to_md import cache_dir
+from openai_client import embed_texts, embedding_model
 
 
 @dataclass
@@ -21,29 +30,144 @@ class CourseCorpus:
 
 
 def check_coverage(_corpus: CourseCorpus) -> str:
-    """Return a placeholder Markdown report for coverage.
+    """Return a Markdown coverage report for the corpus.
+
+    Each source document is split into chunks and embedded (see
+    `_embed_document`); a chunk counts as covered when its best cosine
+    similarity against any cheatsheet chunk reaches
+    COVERAGE_SIMILARITY_THRESHOLD. All similarities are computed in a
+    single matrix product per source category.
+
+    The LLM-based topic/question checklist using COVERAGE_MODEL and
+    COVERAGE_PARAMS is still to be implemented.
+    """
+
+    threshold = float(os.getenv("COVERAGE_SIMILARITY_THRESHOLD", "0.5"))
+    _, cheat_emb = _embed_document(_corpus.cheatsheet)
+
+    buf = io.StringIO()
+    w = buf.write
+    w("# Cheatsheet Coverage Report\n\n")
+    w("Topic and question checklists are not implemented yet; the "
+      "sections below are based on embedding similarity only.\n\n")
+    w("## Sources\n\n")
+    w(f"- Lecture notes files: {_safe_count(_corpus.lecture_notes)}\n")
+    w(f"- Past papers files: {_safe_count(_corpus.past_papers)}\n")
+    w(f"- Assignment question files: {_safe_count(_corpus.assignments)}\n")
+
+    for title, documents in (
+        ("Lecture notes", _corpus.lecture_notes),
+        ("Past papers", _corpus.past_papers),
+        ("Assignment questions", _corpus.assignments),
+    ):
+        chunks: list[str] = []
+        embeddings: list[np.ndarray] = []
+        for document in documents:
+            document_chunks, document_emb = _embed_document(document)
+            if not document_chunks:
+                # Empty documents have no embeddings to concatenate.
+                continue
+            chunks.extend(document_chunks)
+            embeddings.append(document_emb)
+        if not chunks:
+            continue
+
+        chunk_emb = np.concatenate(embeddings)
+        if len(cheat_emb):
+            best = (chunk_emb @ cheat_emb.T).max(axis=1)
+        else:
+            best = np.zeros(len(chunks), dtype=np.float32)
+        uncovered = np.flatnonzero(best < threshold)
+
+        w(f"\n## {title}: similarity coverage\n\n")
+        w(f"{len(chunks) - len(uncovered)} of {len(chunks)} chunks have a cheatsheet "
+          f"match with similarity >= {threshold:g}.\n")
+        if len(uncovered):
+            w("\nPossibly uncovered:\n\n")
+            for idx in uncovered:
+                w(f"- [ ] {_preview(chunks[idx])} (best match {best[idx]:.2f})\n")
+
+    return buf.getvalue()
+
 
-    This is a stub; real implementation should call the LLM defined
-    in COVERAGE_MODEL/COVERAGE_PARAMS to extract topics and questions
-    and compare them with the cheatsheet contents.
+# Chunks are kept well under the embedding model's input limit.
+_EMBED_CHUNK_CHARS = 2000
+
+# Bump when `_chunk_markdown` splits text differently, so cached
+# embeddings built from the old chunks are not reused.
+_CHUNKER_VERSION = 1
+
+
+def _chunk_markdown(text: str, max_chars: int = _EMBED_CHUNK_CHARS) -> list[str]:
+    """Split Markdown into paragraph-aligned chunks of up to `max_chars`."""
+
+    chunks: list[str] = []
+    current = ""
+    for para in text.split("\n\n"):
+        para = para.strip()
+        if not para:
+            continue
+        while len(para) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(para[:max_chars])
+            para = para[max_chars:]
+        if current and len(current) + 2 + len(para) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{para}" if current else para
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _embed_document(text: str) -> tuple[list[str], np.ndarray]:
+    """Chunk a document and return its chunks with their embeddings.
+
+    Row i of the L2-normalised float32 array embeds chunk i. Results are
+    cached on disk under `cache_dir()`, keyed by the content fingerprint
+    of the text, the chunking settings and the embedding model, so
+    unchanged documents are never re-embedded.
     """
 
-    # For now, just echo basic structure.
-    lines: list[str] = []
-    lines.append("# Cheatsheet Coverage Report")
-    lines.append("")
-    lines.append("This is a stub report. Implement LLM-based coverage "
-                 "analysis in `agent.check_coverage`.")
-    lines.append("")
-    lines.append("## Sources")
-    lines.append("")
-    lines.append(f"- Lecture notes files: {_safe_count(_corpus.lecture_notes)}")
-    lines.append(f"- Past papers files: {_safe_count(_corpus.past_papers)}")
-    lines.append(f"- Assignment question files: {_safe_count(_corpus.assignments)}")
-    lines.append("")
-    return "\n".join(lines)
+    chunks = _chunk_markdown(text, _EMBED_CHUNK_CHARS)
+    if not chunks:
+        return chunks, np.zeros((0, 0), dtype=np.float32)
+
+    model = embedding_model()
+    fingerprint = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+    embeddings_dir = cache_dir() / "embeddings"
+    cache_path = embeddings_dir / (
+        f"{fingerprint}-c{_CHUNKER_VERSION}x{_EMBED_CHUNK_CHARS}-{model.replace('/', '_')}.npy"
+    )
+    if cache_path.exists():
+        emb = np.load(cache_path)
+        if len(emb) == len(chunks):
+            return chunks, emb
+
+    emb = np.asarray(embed_texts(chunks, model=model), dtype=np.float32)
+    norms = np.linalg.norm(emb, axis=1, keepdims=True)
+    emb /= np.maximum(norms, 1e-12)
+
+    # Save under a unique temporary name and rename into place, so an
+    # interrupted or concurrent run never leaves a truncated .npy behind.
+    embeddings_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=embeddings_dir, suffix=".npy.tmp", delete=False) as tmp:
+        np.save(tmp, emb)
+    os.replace(tmp.name, cache_path)
+    return chunks, emb
+
+
+def _preview(chunk: str, limit: int = 120) -> str:
+    first_line = chunk.strip().splitlines()[0]
+    if len(first_line) > limit:
+        return first_line[: limit - 3] + "..."
+    return first_line
 
 
 def _safe_count(items: Iterable[str]) -> int:
+    if isinstance(items, Sized):
+        return len(items)
     return sum(1 for _ in items)
 
@@ -4,16 +4,49 @@ from __future__ import annotations
 
 Supported cases:
 - Text files (currently: .md, .txt): returned or lightly normalised.
-- Text PDFs: text extracted via pypdf and wrapped into Markdown.
-- Image-only PDFs: pages rendered to images and OCR'd via pytesseract,
-  then concatenated into Markdown.
+- Text PDFs: text extracted via PyMuPDF (pypdf as a fallback) and
+  wrapped into Markdown.
+- Image-only PDFs: pages rendered to images and OCR'd via a supplied
+  callback, then concatenated into Markdown. Scanned PDFs are detected
+  automatically unless OCR is forced on or off.
+
+Extracted Markdown for PDFs is cached by a fingerprint of the source
+bytes under MD_CACHE_DIR (default `./.md_cache/`), so identical PDFs are
+only extracted once across runs and courses. Each generated sibling .md
+gets a `<name>.md.fp` sidecar recording the fingerprint it was built
+from; when the PDF changes, the stale sibling is rebuilt. A sibling .md
+without a sidecar is treated as hand-written and is never overwritten.
 
 This module does NOT call any LLMs. Higher-level logic (agent.py)
 will decide how to use the resulting Markdown.
 """
 
+import asyncio
+import hashlib
+import heapq
+import inspect
+import io
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Awaitable, Callable, Optional, Union
+
+
+# Pages per pool task when extracting text.
+_PAGES_PER_TASK = 8
+
+# Scanned-PDF detection: sample this many leading pages and treat the
+# document as image-only below this many characters per page.
+_SCANNED_SAMPLE_PAGES = 3
+_SCANNED_CHARS_PER_PAGE = 50
+
+# OCR rendering: scale pages so the long edge is about this many pixels,
+# without zooming in further than _OCR_MAX_ZOOM.
+_OCR_TARGET_LONG_EDGE = 1600
+_OCR_MAX_ZOOM = 2.5
 
 
 class ConversionError(Exception):
@@ -21,153 +54,642 @@ class ConversionError(Exception):
 
 
 QualityChecker = Callable[[str], bool]
-OcrFunc = Callable[[bytes], str]
+# OCR callbacks may be plain functions or coroutine functions. Coroutines
+# run on the converting event loop; plain functions run in a thread.
+OcrFunc = Union[Callable[[bytes], str], Callable[[bytes], Awaitable[str]]]
+# Batch OCR callbacks take several page images and return one string per
+# image, in order.
+OcrBatchFunc = Union[
+    Callable[[list[bytes]], list[str]],
+    Callable[[list[bytes]], Awaitable[list[str]]],
+]
 
 
 def convert_to_markdown(
     path: str | Path,
     quality_checker: Optional[QualityChecker] = None,
     ocr_func: Optional[OcrFunc] = None,
-    use_ocr: bool = False,
+    use_ocr: Optional[bool] = None,
+    ocr_batch_func: Optional[OcrBatchFunc] = None,
 ) -> Path:
     """Convert a document to Markdown and return the .md file path.
 
     Handles three cases:
     1. Text files (.md, .txt): .md is returned as-is; .txt is wrapped
        into a sibling .md file.
-    2. Text PDFs: text is extracted with pypdf and written as Markdown.
-    3. Image-only PDFs: pages are rendered with pdf2image and OCR'd with
-       pytesseract, then written as Markdown.
+    2. Text PDFs: text is extracted with PyMuPDF and written as Markdown.
+    3. Image-only PDFs: pages are rendered with PyMuPDF and passed to
+       `ocr_func` (or in groups to `ocr_batch_func`), then written as
+       Markdown.
+
+    For PDFs, `use_ocr=None` picks between 2 and 3 by sampling how much
+    text the first pages contain; True/False forces a route.
+    """
+
+    md_path, _ = produce_markdown(
+        path,
+        quality_checker=quality_checker,
+        ocr_func=ocr_func,
+        use_ocr=use_ocr,
+        ocr_batch_func=ocr_batch_func,
+    )
+    return md_path
+
+
+def produce_markdown(
+    path: str | Path,
+    quality_checker: Optional[QualityChecker] = None,
+    ocr_func: Optional[OcrFunc] = None,
+    use_ocr: Optional[bool] = None,
+    ocr_batch_func: Optional[OcrBatchFunc] = None,
+) -> tuple[Path, str]:
+    """Like `convert_to_markdown`, but also return the Markdown text.
+
+    Saves callers from re-opening the file that was just written. PDFs
+    go through `produce_markdown_async` on a private event loop and
+    process pool; use that directly to convert many documents at once.
+    """
+
+    src_path = Path(path)
+    if src_path.suffix.lower() != ".pdf":
+        return _produce_plain_markdown(src_path, quality_checker)
+
+    with ProcessPoolExecutor() as cpu_pool:
+        return asyncio.run(
+            produce_markdown_async(
+                src_path,
+                cpu_pool,
+                new_ocr_semaphore(),
+                quality_checker=quality_checker,
+                ocr_func=ocr_func,
+                use_ocr=use_ocr,
+                ocr_batch_func=ocr_batch_func,
+            )
+        )
+
+
+async def produce_markdown_async(
+    path: str | Path,
+    cpu_pool: Executor,
+    ocr_slots: asyncio.Semaphore,
+    quality_checker: Optional[QualityChecker] = None,
+    ocr_func: Optional[OcrFunc] = None,
+    use_ocr: Optional[bool] = None,
+    ocr_batch_func: Optional[OcrBatchFunc] = None,
+) -> tuple[Path, str]:
+    """Async `produce_markdown` for converting many documents at once.
+
+    CPU-bound work (hashing, text extraction, page rendering) runs in
+    `cpu_pool`, split into page ranges so one large PDF spreads over the
+    pool's workers instead of starting a pool of its own. OCR calls run
+    on the current event loop, and `ocr_slots` (see `new_ocr_semaphore`)
+    bounds the OCR requests in flight across every document sharing it.
+    `quality_checker` must be picklable when `cpu_pool` is a process pool.
     """
 
+    loop = asyncio.get_running_loop()
     src_path = Path(path)
+    if src_path.suffix.lower() != ".pdf":
+        return await loop.run_in_executor(
+            cpu_pool, _produce_plain_markdown, src_path, quality_checker
+        )
     if not src_path.exists():
         raise FileNotFoundError(f"Source file not found: {src_path}")
 
-    suffix = src_path.suffix.lower()
+    plan = await loop.run_in_executor(cpu_pool, _prepare_pdf, src_path, _requested_route(use_ocr))
+    if plan.markdown is not None:
+        return plan.md_path, plan.markdown
+
+    if plan.route == "ocr":
+        markdown_text = await _ocr_pdf_async(
+            src_path, ocr_func, ocr_batch_func, cpu_pool=cpu_pool, ocr_slots=ocr_slots
+        )
+    else:
+        markdown_text = await _extract_text_async(src_path, cpu_pool)
+
+    return plan.md_path, _store_pdf_markdown(src_path, plan, markdown_text, quality_checker)
+
+
+def new_ocr_semaphore() -> asyncio.Semaphore:
+    """Return a semaphore sized by OCR_CONCURRENCY.
+
+    Share one across all `produce_markdown_async` calls of a run so the
+    OCR endpoint never sees more than OCR_CONCURRENCY requests at once.
+    """
+
+    return asyncio.Semaphore(_ocr_concurrency())
 
-    # Case 1: plain text files.
+
+def _ocr_concurrency() -> int:
+    return max(1, int(os.getenv("OCR_CONCURRENCY", "8")))
+
+
+def _produce_plain_markdown(
+    src_path: Path, quality_checker: Optional[QualityChecker]
+) -> tuple[Path, str]:
+    """Handle the non-PDF cases: .md is read as-is, .txt is wrapped."""
+
+    if not src_path.exists():
+        raise FileNotFoundError(f"Source file not found: {src_path}")
+
+    suffix = src_path.suffix.lower()
     if suffix == ".md":
-        return src_path
+        return src_path, read_markdown(src_path)
     if suffix == ".txt":
         md_path = src_path.with_suffix(".md")
         if md_path.exists():
-            return md_path
+            return md_path, read_markdown(md_path)
         text = src_path.read_text(encoding="utf-8", errors="ignore")
         markdown = text.strip() + "\n"
         if quality_checker is not None and not quality_checker(markdown):
             raise ConversionError(f"Text from {src_path} failed quality check")
-        md_path.write_text(markdown, encoding="utf-8")
-        return md_path
+        _write_markdown(md_path, markdown)
+        return md_path, markdown
+
+    raise ConversionError(f"Unsupported file type for conversion: {suffix}")
+
+
+@dataclass
+class _PdfPlan:
+    """Outcome of checking a PDF against its sibling .md and the cache.
+
+    `markdown` is set when no extraction is needed; otherwise `route`
+    says how to extract it.
+    """
+
+    md_path: Path
+    fingerprint: str
+    route: Optional[str]
+    markdown: Optional[str] = None
+
+
+def _requested_route(use_ocr: Optional[bool]) -> Optional[str]:
+    return None if use_ocr is None else ("ocr" if use_ocr else "text")
+
+
+def _prepare_pdf(src_path: Path, requested_route: Optional[str]) -> _PdfPlan:
+    """Serve a PDF from its sibling .md or the cache, or pick a route.
+
+    The sibling .md is reused only while it still matches the source. A
+    sibling without a sidecar was not written by this code (e.g. by
+    hand), so it is used as-is and never overwritten.
+    """
 
-    # For non-text inputs, if a sibling .md already exists, reuse it.
     md_path = src_path.with_suffix(".md")
-    if md_path.exists():
-        return md_path
+    if md_path.exists() and not is_generated_markdown(md_path):
+        return _PdfPlan(md_path, "", None, read_markdown(md_path))
 
-    if suffix == ".pdf":
-        if use_ocr:
-            markdown_text = _convert_pdf_to_markdown_ocr(src_path, ocr_func=ocr_func)
-        else:
-            markdown_text = _convert_pdf_to_markdown_text(src_path)
+    fingerprint = _fingerprint(src_path)
+    if md_path.exists():
+        stored, stored_route = _read_fingerprint(md_path)
+        if stored == fingerprint and _route_matches(stored_route, requested_route):
+            return _PdfPlan(md_path, fingerprint, stored_route, read_markdown(md_path))
+
+    cached_path = cache_dir() / f"{fingerprint}.md"
+    _, route = _read_fingerprint(cached_path)
+    if cached_path.exists() and _route_matches(route, requested_route):
+        markdown_text = read_markdown(cached_path)
+        _write_markdown(md_path, markdown_text)
+        _write_fingerprint(md_path, fingerprint, route)
+        return _PdfPlan(md_path, fingerprint, route, markdown_text)
+
+    if requested_route is not None:
+        route = requested_route
     else:
-        raise ConversionError(f"Unsupported file type for conversion: {suffix}")
+        route = "ocr" if _is_scanned(src_path) else "text"
+    return _PdfPlan(md_path, fingerprint, route)
+
+
+def _store_pdf_markdown(
+    src_path: Path,
+    plan: _PdfPlan,
+    markdown_text: str,
+    quality_checker: Optional[QualityChecker],
+) -> str:
+    """Check freshly extracted Markdown and write it to the cache and sibling."""
 
     if quality_checker is not None and not quality_checker(markdown_text):
         raise ConversionError(f"Extracted text for {src_path} failed quality check")
 
-    md_path.write_text(markdown_text, encoding="utf-8")
-    return md_path
+    cached_path = cache_dir() / f"{plan.fingerprint}.md"
+    _write_markdown(cached_path, markdown_text)
+    _write_fingerprint(cached_path, plan.fingerprint, plan.route)
+    _write_markdown(plan.md_path, markdown_text)
+    _write_fingerprint(plan.md_path, plan.fingerprint, plan.route)
+    return markdown_text
+
+
+# Recently read Markdown text, keyed by path and validated against
+# (mtime_ns, size) so edited files are re-read. Only the last
+# _MARKDOWN_MEMO_SIZE files are kept, so large corpora are not held in
+# memory for the whole run.
+_MARKDOWN_MEMO_SIZE = 32
+_markdown_memo: OrderedDict[Path, tuple[int, int, str]] = OrderedDict()
+
+
+def read_markdown(md_path: str | Path) -> str:
+    """Read a Markdown file, reusing the text if it is unchanged on disk."""
+
+    md_path = Path(md_path)
+    st = md_path.stat()
+    memo = _markdown_memo.get(md_path)
+    if memo is not None and memo[0] == st.st_mtime_ns and memo[1] == st.st_size:
+        _markdown_memo.move_to_end(md_path)
+        return memo[2]
+    text = md_path.read_text(encoding="utf-8", errors="ignore")
+    _markdown_memo[md_path] = (st.st_mtime_ns, st.st_size, text)
+    _markdown_memo.move_to_end(md_path)
+    if len(_markdown_memo) > _MARKDOWN_MEMO_SIZE:
+        _markdown_memo.popitem(last=False)
+    return text
+
+
+def _write_markdown(md_path: Path, text: str) -> None:
+    atomic_write_utf8(md_path, text)
+    # Callers already hold the text; drop any stale copy instead of
+    # memoising it.
+    _markdown_memo.pop(md_path, None)
+
+
+def atomic_write_utf8(path: str | Path, data: str) -> None:
+    """Write `data` as UTF-8 to `path` with raw fd writes, atomically.
+
+    Bypasses the TextIOWrapper layer and writes the encoded bytes to a
+    temporary sibling, then renames it over `path`, so readers never see
+    a partially written file. Each call uses its own temporary name, so
+    concurrent writers of the same path (e.g. pool workers converting
+    identical PDFs) do not clobber each other; the last rename wins.
+    """
+
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    payload = memoryview(data.encode("utf-8"))
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        while payload:
+            payload = payload[os.write(fd, payload):]
+    except BaseException:
+        os.close(fd)
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.close(fd)
+    os.replace(tmp_path, path)
+
+
+def is_generated_markdown(md_path: str | Path) -> bool:
+    """Return True if `md_path` was produced by `convert_to_markdown`."""
+
+    return _fingerprint_path(Path(md_path)).exists()
+
+
+def cache_dir() -> Path:
+    """Return the Markdown cache directory, creating it if needed."""
+
+    path = Path(os.getenv("MD_CACHE_DIR", "./.md_cache"))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _fingerprint(src_path: Path) -> str:
+    """Return a content fingerprint of a source file's raw bytes."""
+
+    return hashlib.blake2b(src_path.read_bytes(), digest_size=16).hexdigest()
+
+
+def _fingerprint_path(md_path: Path) -> Path:
+    return md_path.with_name(md_path.name + ".fp")
+
+
+def _read_fingerprint(md_path: Path) -> tuple[Optional[str], Optional[str]]:
+    """Return the (fingerprint, route) recorded for `md_path`, if any.
+
+    The route is "text" or "ocr", or None for sidecars that predate
+    automatic routing.
+    """
+
+    fp_path = _fingerprint_path(md_path)
+    if not fp_path.exists():
+        return None, None
+    fields = fp_path.read_text(encoding="utf-8").split()
+    if not fields:
+        return None, None
+    return fields[0], (fields[1] if len(fields) > 1 else None)
+
+
+def _write_fingerprint(md_path: Path, fingerprint: str, route: Optional[str] = None) -> None:
+    content = fingerprint + "\n" if route is None else f"{fingerprint}\n{route}\n"
+    atomic_write_utf8(_fingerprint_path(md_path), content)
+
 
+def _route_matches(stored: Optional[str], requested: Optional[str]) -> bool:
+    return requested is None or stored is None or stored == requested
 
-def _convert_pdf_to_markdown_text(pdf_path: Path) -> str:
-    """Convert a text-based PDF to Markdown using pypdf only."""
+
+def _is_scanned(pdf_path: Path) -> bool:
+    """Guess whether a PDF is image-only by sampling its first pages.
+
+    Pages averaging fewer than `_SCANNED_CHARS_PER_PAGE` extractable
+    characters are treated as scans. Without PyMuPDF the text path is
+    assumed.
+    """
+
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        return False
+
+    with fitz.open(str(pdf_path)) as doc:
+        sample = min(_SCANNED_SAMPLE_PAGES, doc.page_count)
+        if sample == 0:
+            return False
+        chars = sum(len(doc.load_page(idx).get_text("text").strip()) for idx in range(sample))
+    return chars / sample < _SCANNED_CHARS_PER_PAGE
+
+
+async def _extract_text_async(pdf_path: Path, cpu_pool: Executor) -> str:
+    """Extract a text PDF in `_PAGES_PER_TASK`-page ranges on `cpu_pool`.
+
+    Uses PyMuPDF, falling back to pypdf (in a single task) only when
+    PyMuPDF is not installed.
+    """
+
+    loop = asyncio.get_running_loop()
+    try:
+        import fitz  # noqa: F401 - PyMuPDF, only checking availability
+    except ImportError:
+        page_texts = await loop.run_in_executor(cpu_pool, _extract_pages_pypdf, str(pdf_path))
+        return _assemble_text_pages(pdf_path, page_texts)
+
+    page_count = await loop.run_in_executor(cpu_pool, _page_count, str(pdf_path))
+    ranges = [
+        (start, min(start + _PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, _PAGES_PER_TASK)
+    ]
+    chunks = await _gather_or_cancel(
+        *(loop.run_in_executor(cpu_pool, _extract_page_range, str(pdf_path), r) for r in ranges)
+    )
+    return _assemble_text_pages(pdf_path, [text for chunk in chunks for text in chunk])
+
+
+def _extract_pages_pypdf(pdf_path_str: str) -> list[str]:
+    """Worker: extract every page's text with pypdf."""
 
     try:
         from pypdf import PdfReader
     except ImportError as exc:
-        raise ConversionError("pypdf is required for PDF conversion but is not installed") from exc
+        raise ConversionError(
+            "PyMuPDF (fitz) or pypdf is required for PDF conversion but neither is installed"
+        ) from exc
+
+    reader = PdfReader(pdf_path_str)
+    return [page.extract_text() or "" for page in reader.pages]
 
-    reader = PdfReader(str(pdf_path))
-    page_texts: list[str] = []
-    for page in reader.pages:
-        text = page.extract_text() or ""
-        page_texts.append(text)
 
-    lines: list[str] = []
+def _assemble_text_pages(pdf_path: Path, page_texts: list[str]) -> str:
+    buf = io.StringIO()
     for idx, text in enumerate(page_texts, start=1):
         clean = text.strip()
-        if not clean:
-            continue
-        lines.append(f"Page {idx}")
-        lines.append("")
-        lines.append(clean)
-        lines.append("")
-
-    if not lines:
+        if clean:
+            _write_page_block(buf, idx, clean)
+
+    if not buf.tell():
         raise ConversionError(f"No usable text extracted from PDF: {pdf_path}")
 
-    return "\n".join(lines)
+    return buf.getvalue()
+
 
+def _page_count(pdf_path_str: str) -> int:
+    import fitz  # PyMuPDF
 
-def _convert_pdf_to_markdown_ocr(pdf_path: Path, ocr_func: Optional[OcrFunc]) -> str:
-    """Convert a PDF to Markdown via OCR on rendered page images."""
+    with fitz.open(pdf_path_str) as doc:
+        return doc.page_count
 
-    if ocr_func is None:
-        raise ConversionError("OCR conversion requested but no OCR function was provided")
+
+def _write_page_block(buf: io.StringIO, page_number: int, text: str) -> None:
+    """Append a "Page N" Markdown block, separated from any previous one."""
+
+    w = buf.write
+    if buf.tell():
+        w("\n")
+    w("Page ")
+    w(str(page_number))
+    w("\n\n")
+    w(text)
+    w("\n")
+
+
+def _extract_page_range(pdf_path_str: str, page_range: tuple[int, int]) -> list[str]:
+    """Worker: extract text for pages [start, stop) of a PDF.
+
+    Each worker opens its own document, as PyMuPDF documents cannot be
+    shared across processes.
+    """
+
+    import fitz  # PyMuPDF
+
+    start, stop = page_range
+    with fitz.open(pdf_path_str) as doc:
+        return [doc.load_page(idx).get_text("text") or "" for idx in range(start, stop)]
+
+
+async def _ocr_pdf_async(
+    pdf_path: Path,
+    ocr_func: Optional[OcrFunc],
+    ocr_batch_func: Optional[OcrBatchFunc],
+    cpu_pool: Executor,
+    ocr_slots: asyncio.Semaphore,
+) -> str:
+    """OCR a PDF on the running event loop, rendering pages in `cpu_pool`.
+
+    A batch holds its OCR slot from rendering until its OCR finishes, so
+    the slots bound both requests in flight and page images in memory.
+    """
+
+    batch_func, batch_size = _select_batch_func(ocr_func, ocr_batch_func)
+    if not inspect.iscoroutinefunction(batch_func):
+        sync_batch_func = batch_func
+
+        async def batch_func(images: list[bytes]) -> list[str]:
+            return await asyncio.to_thread(sync_batch_func, images)
 
     try:
-        import fitz  # PyMuPDF
+        import fitz  # noqa: F401 - PyMuPDF, only checking availability
     except ImportError as exc:
         raise ConversionError("PyMuPDF (fitz) is required for OCR-based PDF conversion but is not installed") from exc
 
-    doc = fitz.open(str(pdf_path))
-    if doc.page_count == 0:
+    loop = asyncio.get_running_loop()
+    page_count = await loop.run_in_executor(cpu_pool, _page_count, str(pdf_path))
+    if page_count == 0:
         raise ConversionError(f"No pages in PDF for OCR: {pdf_path}")
 
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    writer = _OrderedPageWriter()
+
+    async def _ocr_batch(pages: range) -> None:
+        async with ocr_slots:
+            images = await loop.run_in_executor(
+                cpu_pool, _render_page_range, str(pdf_path), (pages.start, pages.stop)
+            )
+            print(f"Running OCR for {_describe_pages(pages)} of {pdf_path.name}...")
+            texts = await batch_func(images)
+            print(f"Finished OCR for {_describe_pages(pages)} of {pdf_path.name}.")
+        writer.add_batch(pages, texts)
+
+    await _gather_or_cancel(
+        *(
+            _ocr_batch(range(start, min(start + batch_size, page_count)))
+            for start in range(0, page_count, batch_size)
+        )
+    )
+
+    markdown = writer.getvalue(page_count)
+    if not markdown:
+        raise ConversionError(f"OCR produced no content for PDF: {pdf_path}")
+    return markdown
+
 
-    def _render_and_ocr(page_index: int) -> tuple[int, str]:
-        page = doc.load_page(page_index)
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x zoom for better OCR
-        image_bytes = pix.tobytes("png")
-        print(f"Running OCR for page {page_index + 1}...")
-        text = ocr_func(image_bytes)
-        print(f"Finished OCR for page {page_index + 1}.")
-        return page_index, (text or "").strip()
+async def _gather_or_cancel(*aws: Awaitable) -> list:
+    """Like `asyncio.gather`, but cancel the others as soon as one fails.
 
-    results: dict[int, str] = {}
+    A document that fails part-way must not keep rendering pages or
+    holding OCR slots for results nobody will read.
+    """
+
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def _select_batch_func(
+    ocr_func: Optional[OcrFunc], ocr_batch_func: Optional[OcrBatchFunc]
+) -> tuple[OcrBatchFunc, int]:
+    """Pick the OCR callback and pages per call from OCR_BATCH_SIZE."""
+
+    batch_size = max(1, int(os.getenv("OCR_BATCH_SIZE", "4")))
+    if ocr_batch_func is not None and (batch_size > 1 or ocr_func is None):
+        return ocr_batch_func, batch_size
+    if ocr_func is not None:
+        return _as_batch_func(ocr_func), 1
+    raise ConversionError("OCR conversion requested but no OCR function was provided")
+
+
+def _render_page_range(pdf_path_str: str, page_range: tuple[int, int]) -> list[bytes]:
+    """Worker: render pages [start, stop) of a PDF to OCR-ready JPEG bytes."""
+
+    import fitz  # PyMuPDF
+
+    start, stop = page_range
+    with fitz.open(pdf_path_str) as doc:
+        return [_render_page_jpeg(doc.load_page(idx)) for idx in range(start, stop)]
+
+
+def _as_batch_func(ocr_func: OcrFunc) -> OcrBatchFunc:
+    """Adapt a single-image OCR callback to the batch signature."""
+
+    if inspect.iscoroutinefunction(ocr_func):
+
+        async def _ocr_one_async(images: list[bytes]) -> list[str]:
+            return [await ocr_func(image_bytes) for image_bytes in images]
+
+        return _ocr_one_async
+
+    def _ocr_one(images: list[bytes]) -> list[str]:
+        return [ocr_func(image_bytes) for image_bytes in images]
+
+    return _ocr_one
+
+
+class _OrderedPageWriter:
+    """Emit OCR'd pages as "Page N" blocks in page order.
 
-    with ThreadPoolExecutor() as executor:
-        futures = {executor.submit(_render_and_ocr, idx): idx for idx in range(doc.page_count)}
-        for future in as_completed(futures):
-            page_index, clean = future.result()
+    Pages finish out of order; early arrivals wait in a min-heap and are
+    written as soon as every page before them has been written, so only
+    the out-of-order backlog is held separately from the output.
+    """
+
+    def __init__(self) -> None:
+        self.buf = io.StringIO()
+        self._pending: list[tuple[int, str]] = []
+        self._next_index = 0
+
+    def add(self, page_index: int, text: str) -> None:
+        heapq.heappush(self._pending, (page_index, text))
+        while self._pending and self._pending[0][0] == self._next_index:
+            _, clean = heapq.heappop(self._pending)
             if clean:
-                results[page_index] = clean
+                _write_page_block(self.buf, self._next_index + 1, clean)
+            self._next_index += 1
 
-    if not results:
-        raise ConversionError(f"OCR produced no content for PDF: {pdf_path}")
+    def add_batch(self, pages: range, texts: list[str]) -> None:
+        """Add one OCR batch, which must hold exactly one text per page."""
+
+        if len(texts) != len(pages):
+            raise ConversionError(
+                f"OCR returned {len(texts)} results for {len(pages)} pages ({_describe_pages(pages)})"
+            )
+        for page_index, text in zip(pages, texts):
+            self.add(page_index, (text or "").strip())
 
-    lines: list[str] = []
-    for idx in sorted(results):
-        lines.append(f"Page {idx + 1}")
-        lines.append("")
-        lines.append(results[idx])
-        lines.append("")
-    return "\n".join(lines)
+    def getvalue(self, page_count: int) -> str:
+        """Return the Markdown once all `page_count` pages have been added."""
+
+        if self._pending or self._next_index != page_count:
+            raise ConversionError(
+                f"OCR results incomplete: {self._next_index} of {page_count} pages written"
+            )
+        return self.buf.getvalue()
+
+
+def _render_page_jpeg(page) -> bytes:
+    """Render a page to grayscale JPEG bytes for OCR.
+
+    The page is scaled so its long edge is about `_OCR_TARGET_LONG_EDGE`
+    pixels (capped at `_OCR_MAX_ZOOM`), which is enough for the vision
+    model. Grayscale without alpha and JPEG quality 85 keep both the
+    encode cost and the upload small.
+    """
+
+    import fitz  # PyMuPDF
+
+    zoom = _compute_zoom(page.rect)
+    pix = page.get_pixmap(
+        matrix=fitz.Matrix(zoom, zoom),
+        colorspace=fitz.csGRAY,
+        alpha=False,
+    )
+    return pix.tobytes("jpg", jpg_quality=85)
+
+
+def _compute_zoom(rect) -> float:
+    """Return the zoom that maps the page's long edge to the OCR target."""
+
+    long_edge = max(rect.width, rect.height)
+    if long_edge <= 0:
+        return 1.0
+    return min(_OCR_TARGET_LONG_EDGE / long_edge, _OCR_MAX_ZOOM)
+
+
+def _describe_pages(pages: range) -> str:
+    if len(pages) == 1:
+        return f"page {pages.start + 1}"
+    return f"pages {pages.start + 1}-{pages.stop}"
 
 
 if __name__ == "__main__":  # Simple manual testing entrypoint.
     import argparse
 
-    from openai_client import llm_ocr
+    from openai_client import llm_ocr_async, llm_ocr_batch_async
 
     parser = argparse.ArgumentParser(description="Convert a file to Markdown.")
     parser.add_argument("path", help="Path to the source file")
     parser.add_argument(
         "--ocr",
         action="store_true",
-        help="Use LLM OCR for PDF files instead of text extraction",
+        help="Force LLM OCR for PDF files (default: auto-detect scanned PDFs)",
     )
     args = parser.parse_args()
 
@@ -176,12 +698,11 @@ if __name__ == "__main__":  # Simple manual testing entrypoint.
     def _dummy_quality_checker(text: str) -> bool:  # pragma: no cover
         return bool(text.strip())
 
-    ocr_cb = llm_ocr if args.ocr else None
-
     out = convert_to_markdown(
         src,
         quality_checker=_dummy_quality_checker,
-        ocr_func=ocr_cb,
-        use_ocr=bool(args.ocr),
+        ocr_func=llm_ocr_async,
+        ocr_batch_func=llm_ocr_batch_async,
+        use_ocr=True if args.ocr else None,
     )
     print(out)
@@ -3,33 +3,48 @@ from __future__ import annotations
 """Entry point for the cheatsheet coverage agent.
 
 Usage:
-    python main.py CS231
+    python main.py CS231 [--force]
 
 This will:
 - Locate the course directory under COURSES_BASE_DIR.
 - Convert relevant files in lecture_notes, past_papers, and
-  assignment/question to Markdown using `file_to_md`.
+  assignment/question to Markdown using `file_to_md`, all folders
+  concurrently. CPU-bound work shares one process pool; OCR requests
+  share one client and the OCR_CONCURRENCY limit.
 - Read the cheatsheet (MD or PDF converted to MD).
 - Call the agent to compute a coverage report and write it to
   REPORTS_DIR/<course_code>_coverage_report.md.
 
+If the report is already newer than the cheatsheet and every source
+file, the run exits early; pass --force to regenerate anyway.
+
 Per-folder OCR behaviour for PDFs is controlled via environment
-variables (defaults to text extraction):
-- LECTURE_NOTES_USE_OCR ("true"/"false")
+variables (unset or "auto" detects scanned PDFs and OCRs only those):
+- LECTURE_NOTES_USE_OCR ("true"/"false"/"auto")
 - PAST_PAPERS_USE_OCR
 - ASSIGNMENT_USE_OCR
 - CHEATSHEET_USE_OCR
 """
 
+import asyncio
+import itertools
 import os
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
-from typing import Iterable
+from typing import Iterator, Optional
 
 from dotenv import load_dotenv
 
 from agent import CourseCorpus, check_coverage
-from file_to_md import ConversionError, convert_to_markdown
-from openai_client import llm_ocr
+from file_to_md import (
+    ConversionError,
+    atomic_write_utf8,
+    is_generated_markdown,
+    new_ocr_semaphore,
+    produce_markdown_async,
+    read_markdown,
+)
+from openai_client import llm_ocr_async, llm_ocr_batch_async
 
 
 def _env_flag(name: str, default: bool = False) -> bool:
@@ -39,68 +54,167 @@ def _env_flag(name: str, default: bool = False) -> bool:
     return value.strip().lower() in {"1", "true", "yes", "y"}
 
 
-def _gather_markdown_files(base_dir: Path, use_ocr: bool) -> list[str]:
+def _env_ocr_mode(name: str) -> Optional[bool]:
+    """Read a per-folder OCR setting; None means auto-detect per PDF."""
+
+    value = os.getenv(name)
+    if value is None or value.strip().lower() in {"", "auto"}:
+        return None
+    return _env_flag(name)
+
+
+def _describe_ocr_mode(use_ocr: Optional[bool]) -> str:
+    return "auto" if use_ocr is None else str(use_ocr)
+
+
+_CONVERTIBLE_SUFFIXES = {".md", ".txt", ".pdf"}
+
+
+def _iter_convertible(base_dir: Path) -> Iterator[Path]:
+    """Yield convertible files under `base_dir` in sorted path order.
+
+    Walks with `os.scandir` so non-matching entries are rejected by name
+    without a stat call. Entries are sorted per directory, which yields
+    the same order as `sorted(base_dir.rglob("*"))`.
+    """
+
+    def _sorted_entries(directory: str) -> Iterator[os.DirEntry[str]]:
+        with os.scandir(directory) as it:
+            return iter(sorted(it, key=lambda entry: entry.name))
+
+    stack = [_sorted_entries(str(base_dir))]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            stack.append(_sorted_entries(entry.path))
+        elif os.path.splitext(entry.name)[1].lower() in _CONVERTIBLE_SUFFIXES:
+            yield Path(entry.path)
+
+
+async def _convert_file(
+    path: Path, use_ocr: Optional[bool], cpu_pool: Executor, ocr_slots: asyncio.Semaphore
+) -> str:
+    """Convert one file with `produce_markdown_async` and return the text."""
+
+    _, markdown = await produce_markdown_async(
+        path,
+        cpu_pool=cpu_pool,
+        ocr_slots=ocr_slots,
+        ocr_func=llm_ocr_async if use_ocr is not False else None,
+        use_ocr=use_ocr,
+        ocr_batch_func=llm_ocr_batch_async if use_ocr is not False else None,
+    )
+    return markdown
+
+
+async def _gather_markdown_files(
+    base_dir: Path, use_ocr: Optional[bool], cpu_pool: Executor, ocr_slots: asyncio.Semaphore
+) -> list[str]:
     """Convert supported files under a directory tree to Markdown.
 
-    Returns a list of Markdown strings, one per file.
+    .txt and .pdf files are converted concurrently (see `_build_corpus`);
+    .md files are read directly. Returns a list of Markdown strings, one per
+    file, in path order.
     """
 
-    markdown_texts: list[str] = []
     if not base_dir.exists():
-        return markdown_texts
+        return []
 
-    for path in sorted(base_dir.rglob("*")):
-        if path.is_dir():
-            continue
+    async def _convert(path: Path) -> Optional[str]:
         suffix = path.suffix.lower()
-        if suffix not in {".md", ".txt", ".pdf"}:
-            continue
-
+        if suffix == ".md":
+            # Already Markdown: read it here rather than round-tripping
+            # through the process pool.
+            return read_markdown(path)
         try:
-            md_path = convert_to_markdown(
-                path,
-                ocr_func=llm_ocr if use_ocr else None,
-                use_ocr=use_ocr if suffix == ".pdf" else False,
+            return await _convert_file(
+                path, use_ocr if suffix == ".pdf" else False, cpu_pool, ocr_slots
             )
-            markdown_texts.append(md_path.read_text(encoding="utf-8", errors="ignore"))
         except ConversionError as exc:
             print(f"[WARN] Skipping {path} due to conversion error: {exc}")
+            return None
 
-    return markdown_texts
+    results = await asyncio.gather(*(_convert(path) for path in _iter_convertible(base_dir)))
+    return [markdown for markdown in results if markdown is not None]
 
 
-def _load_cheatsheet(course_dir: Path, use_ocr: bool) -> str:
+async def _load_cheatsheet(
+    course_dir: Path, use_ocr: Optional[bool], cpu_pool: Executor, ocr_slots: asyncio.Semaphore
+) -> str:
     """Load the cheatsheet for a course as Markdown text.
 
     Behaviour:
-    - If `cheatsheet.md` exists, read and return it directly.
-    - If only `cheatsheet.pdf` exists, always convert it on-the-fly via
-      `convert_to_markdown` but do not rely on or reuse any previously
-      generated Markdown copy by name; the content is read and only the
-      text is used by the agent.
+    - If `cheatsheet.md` exists and was written by hand, read and return
+      it directly.
+    - If only `cheatsheet.pdf` exists, convert it via
+      `produce_markdown_async`. The conversion is keyed on the PDF's
+      content fingerprint, so it is only re-extracted when the PDF has
+      changed since the last run.
     """
 
     md_path = course_dir / "cheatsheet.md"
     pdf_path = course_dir / "cheatsheet.pdf"
 
-    if md_path.exists():
-        return md_path.read_text(encoding="utf-8", errors="ignore")
+    if md_path.exists() and not (pdf_path.exists() and is_generated_markdown(md_path)):
+        return read_markdown(md_path)
     if pdf_path.exists():
         try:
-            # Always convert from the PDF source so we get a fresh view
-            # of the cheatsheet content for this run.
-            md_converted = convert_to_markdown(
-                pdf_path,
-                ocr_func=llm_ocr if use_ocr else None,
-                use_ocr=use_ocr,
-            )
+            return await _convert_file(pdf_path, use_ocr, cpu_pool, ocr_slots)
         except ConversionError as exc:
             raise SystemExit(f"Failed to convert cheatsheet PDF: {exc}") from exc
-        return md_converted.read_text(encoding="utf-8", errors="ignore")
 
     raise SystemExit(f"No cheatsheet.md or cheatsheet.pdf found in {course_dir}")
 
 
+async def _build_corpus(
+    course_dir: Path,
+    cheatsheet_use_ocr: Optional[bool],
+    lecture_notes: tuple[Path, Optional[bool]],
+    past_papers: tuple[Path, Optional[bool]],
+    assignments: tuple[Path, Optional[bool]],
+) -> CourseCorpus:
+    """Convert the cheatsheet and all source folders concurrently.
+
+    Each folder is given as a `(directory, use_ocr)` pair. CPU-bound
+    work (hashing, text extraction, page rendering) runs in one shared
+    process pool. OCR requests run on this event loop, so they share one
+    AsyncOpenAI client and one OCR_CONCURRENCY limit for the whole run.
+    """
+
+    slots = new_ocr_semaphore()
+    with ProcessPoolExecutor() as cpu_pool:
+        cheatsheet_md, lecture_md_list, past_md_list, assignment_md_list = await asyncio.gather(
+            _load_cheatsheet(course_dir, cheatsheet_use_ocr, cpu_pool, slots),
+            _gather_markdown_files(*lecture_notes, cpu_pool, slots),
+            _gather_markdown_files(*past_papers, cpu_pool, slots),
+            _gather_markdown_files(*assignments, cpu_pool, slots),
+        )
+
+    return CourseCorpus(
+        cheatsheet=cheatsheet_md,
+        lecture_notes=lecture_md_list,
+        past_papers=past_md_list,
+        assignments=assignment_md_list,
+    )
+
+
+def _report_is_current(output_path: Path, course_dir: Path, source_dirs: list[Path]) -> bool:
+    """Return True if the report is newer than the cheatsheet and every source."""
+
+    if not output_path.exists():
+        return False
+
+    inputs = itertools.chain(
+        *(_iter_convertible(d) for d in source_dirs if d.exists()),
+        (course_dir / "cheatsheet.md", course_dir / "cheatsheet.pdf"),
+    )
+    max_input_mtime = max((p.stat().st_mtime for p in inputs if p.exists()), default=0.0)
+    return output_path.stat().st_mtime >= max_input_mtime
+
+
 def main() -> None:
     load_dotenv()
 
@@ -108,6 +222,11 @@ def main() -> None:
 
     parser = argparse.ArgumentParser(description="Cheatsheet coverage agent")
     parser.add_argument("course_code", help="Course code, e.g. CS231")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Regenerate the report even if no inputs changed since it was written",
+    )
     args = parser.parse_args()
 
     base_dir = Path(os.getenv("COURSES_BASE_DIR", "./course"))
@@ -122,32 +241,39 @@ def main() -> None:
     past_papers_dir = course_dir / "past_papers"
     assignment_dir = course_dir / "assignment" / "question"
 
-    lecture_use_ocr = _env_flag("LECTURE_NOTES_USE_OCR", default=False)
-    past_use_ocr = _env_flag("PAST_PAPERS_USE_OCR", default=False)
-    assignment_use_ocr = _env_flag("ASSIGNMENT_USE_OCR", default=False)
-    cheatsheet_use_ocr = _env_flag("CHEATSHEET_USE_OCR", default=False)
+    output_path = reports_dir / f"{args.course_code}_coverage_report.md"
+    if not args.force and _report_is_current(
+        output_path,
+        course_dir,
+        [lecture_dir, past_papers_dir, assignment_dir],
+    ):
+        print(f"[INFO] Coverage report {output_path} is up-to-date (use --force to regenerate)")
+        return
+
+    lecture_use_ocr = _env_ocr_mode("LECTURE_NOTES_USE_OCR")
+    past_use_ocr = _env_ocr_mode("PAST_PAPERS_USE_OCR")
+    assignment_use_ocr = _env_ocr_mode("ASSIGNMENT_USE_OCR")
+    cheatsheet_use_ocr = _env_ocr_mode("CHEATSHEET_USE_OCR")
 
     print(f"[INFO] Processing course {args.course_code} in {course_dir}")
-    print(f"[INFO] OCR settings - lecture_notes={lecture_use_ocr}, past_papers={past_use_ocr}, "
-          f"assignment={assignment_use_ocr}, cheatsheet={cheatsheet_use_ocr}")
-
-    cheatsheet_md = _load_cheatsheet(course_dir, use_ocr=cheatsheet_use_ocr)
-
-    lecture_md_list = _gather_markdown_files(lecture_dir, use_ocr=lecture_use_ocr)
-    past_md_list = _gather_markdown_files(past_papers_dir, use_ocr=past_use_ocr)
-    assignment_md_list = _gather_markdown_files(assignment_dir, use_ocr=assignment_use_ocr)
-
-    corpus = CourseCorpus(
-        cheatsheet=cheatsheet_md,
-        lecture_notes=lecture_md_list,
-        past_papers=past_md_list,
-        assignments=assignment_md_list,
+    print(f"[INFO] OCR settings - lecture_notes={_describe_ocr_mode(lecture_use_ocr)}, "
+          f"past_papers={_describe_ocr_mode(past_use_ocr)}, "
+          f"assignment={_describe_ocr_mode(assignment_use_ocr)}, "
+          f"cheatsheet={_describe_ocr_mode(cheatsheet_use_ocr)}")
+
+    corpus = asyncio.run(
+        _build_corpus(
+            course_dir,
+            cheatsheet_use_ocr=cheatsheet_use_ocr,
+            lecture_notes=(lecture_dir, lecture_use_ocr),
+            past_papers=(past_papers_dir, past_use_ocr),
+            assignments=(assignment_dir, assignment_use_ocr),
+        )
     )
 
     report_markdown = check_coverage(corpus)
 
-    output_path = reports_dir / f"{args.course_code}_coverage_report.md"
-    output_path.write_text(report_markdown, encoding="utf-8")
+    atomic_write_utf8(output_path, report_markdown)
     print(f"[INFO] Coverage report written to {output_path}")
 
 
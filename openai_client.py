@@ -7,38 +7,78 @@ small utilities that other modules (e.g. the agent or OCR helpers)
 can use without duplicating setup code.
 """
 
+import asyncio
 import base64
+import functools
 import json
 import os
+import re
+import weakref
 from typing import Any
 
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 
 load_dotenv()
 
 
-def _build_client() -> OpenAI:
+_OCR_PROMPT_MD = (
+    "You are extracting text from a scanned lecture slide or exam page.\n\n"
+    "Return the visible text as clean Markdown, preserving headings and "
+    "bullet points where obvious. Do not add commentary beyond what is "
+    "visible in the image."
+)
+
+
+def _client_kwargs() -> dict[str, Any]:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY is not set")
 
+    kwargs: dict[str, Any] = {"api_key": api_key}
     base_url = os.getenv("OPENAI_BASE_URL")
     if base_url:
-        return OpenAI(api_key=api_key, base_url=base_url)
-    return OpenAI(api_key=api_key)
+        kwargs["base_url"] = base_url
+    return kwargs
 
 
-def llm_ocr(image_bytes: bytes) -> str:
-    """Use an OpenAI model with vision capabilities to OCR an image.
+def _http_client_options() -> dict[str, Any]:
+    """Options for the keep-alive HTTP pool shared by every request.
 
-    The model and params are read from TEXT_EXTRACTION_MODEL and
-    TEXT_EXTRACTION_PARAMS in the environment. The prompt always uses
-    Markdown so that downstream consumers can rely on Markdown text.
+    HTTP/2 is enabled when the optional `h2` package is installed, so
+    concurrent OCR calls multiplex over a few TLS connections.
     """
 
-    client = _build_client()
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        http2 = False
+    else:
+        http2 = True
+
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        "timeout": httpx.Timeout(60.0),
+    }
+
+
+def _build_client() -> OpenAI:
+    return OpenAI(http_client=httpx.Client(**_http_client_options()), **_client_kwargs())
+
+
+@functools.lru_cache(maxsize=1)
+def _client() -> OpenAI:
+    """Return the shared sync client, built on first use."""
+
+    return _build_client()
+
+
+@functools.lru_cache(maxsize=1)
+def _extraction_config() -> tuple[str, dict[str, Any]]:
+    """Return the OCR model name and its parsed extra params."""
 
     model = os.getenv("TEXT_EXTRACTION_MODEL") or "gpt-4.1-mini"
     params_raw = os.getenv("TEXT_EXTRACTION_PARAMS") or "{}"
@@ -47,41 +87,206 @@ def llm_ocr(image_bytes: bytes) -> str:
         extra_params: dict[str, Any] = json.loads(params_raw)
     except json.JSONDecodeError as exc:
         raise RuntimeError("TEXT_EXTRACTION_PARAMS must be valid JSON") from exc
+    return model, extra_params
 
-    image_b64 = base64.b64encode(image_bytes).decode("utf-8")
 
-    prompt_md = (
-        "You are extracting text from a scanned lecture slide or exam page.\n\n"
-        "Return the visible text as clean Markdown, preserving headings and "
-        "bullet points where obvious. Do not add commentary beyond what is "
-        "visible in the image."
-    )
+def reset_client() -> None:
+    """Drop cached clients and config so the next call re-reads the env."""
+
+    _client.cache_clear()
+    _extraction_config.cache_clear()
+    _async_clients.clear()
+
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
+def _build_async_client() -> AsyncOpenAI:
+    return AsyncOpenAI(http_client=httpx.AsyncClient(**_http_client_options()), **_client_kwargs())
+
+
+# One async client per event loop: the underlying HTTP pool is bound to
+# the loop it was first used on, but every page OCR'd within a single
+# `asyncio.run` shares the same connections.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_async_client() -> AsyncOpenAI:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _build_async_client()
+        _async_clients[loop] = client
+    return client
+
+
+def _image_data_url(image_bytes: bytes) -> str:
+    """Encode an image as a data URL, detecting JPEG vs PNG by signature."""
+
+    mime = "image/jpeg" if image_bytes[:3] == b"\xff\xd8\xff" else "image/png"
+    return f"data:{mime};base64,{base64.b64encode(image_bytes).decode('ascii')}"
+
+
+def _ocr_request(image_bytes: bytes) -> dict[str, Any]:
+    """Build the chat completion kwargs for OCR'ing a single image.
+
+    The model and params are read from TEXT_EXTRACTION_MODEL and
+    TEXT_EXTRACTION_PARAMS in the environment.
+    """
+
+    model, extra_params = _extraction_config()
+
+    return {
+        "model": model,
+        "messages": [
             {
                 "role": "user",
                 "content": [
-                    {"type": "text", "text": prompt_md},
+                    {"type": "text", "text": _OCR_PROMPT_MD},
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/png;base64,{image_b64}",
+                            "url": _image_data_url(image_bytes),
                         },
                     },
                 ],
             }
         ],
         **extra_params,
+    }
+
+
+def _ocr_batch_request(images: list[bytes]) -> dict[str, Any]:
+    """Build the chat completion kwargs for OCR'ing several pages at once.
+
+    Token limits from TEXT_EXTRACTION_PARAMS are per page, so they are
+    scaled by the number of images.
+    """
+
+    model, extra_params = _extraction_config()
+    params = dict(extra_params)
+    for key in ("max_tokens", "max_completion_tokens"):
+        if key in params:
+            params[key] = params[key] * len(images)
+
+    prompt_md = (
+        f"{_OCR_PROMPT_MD}\n\n"
+        f"The {len(images)} images are consecutive pages. For each image k "
+        f"(1 to {len(images)}, in order), output a line containing exactly "
+        "<<<PAGE k>>> followed by that page's Markdown."
+    )
+    content: list[dict[str, Any]] = [{"type": "text", "text": prompt_md}]
+    content.extend(
+        {"type": "image_url", "image_url": {"url": _image_data_url(image_bytes)}}
+        for image_bytes in images
     )
 
+    return {
+        "model": model,
+        "messages": [{"role": "user", "content": content}],
+        **params,
+    }
+
+
+_PAGE_MARKER = re.compile(r"^\s*<<<PAGE (\d+)>>>\s*$", re.MULTILINE)
+
+
+def _split_batch_response(content: str | None, page_count: int) -> list[str] | None:
+    """Split a batched OCR response on its page markers.
+
+    Returns None unless the markers are exactly 1..page_count in order.
+    """
+
+    parts = _PAGE_MARKER.split(content or "")
+    numbers = [int(n) for n in parts[1::2]]
+    if numbers != list(range(1, page_count + 1)):
+        return None
+    return [text.strip() for text in parts[2::2]]
+
+
+def llm_ocr(image_bytes: bytes) -> str:
+    """Use an OpenAI model with vision capabilities to OCR an image.
+
+    The model and params are read from TEXT_EXTRACTION_MODEL and
+    TEXT_EXTRACTION_PARAMS in the environment. The prompt always uses
+    Markdown so that downstream consumers can rely on Markdown text.
+    """
+
+    client = _client()
+    response = client.chat.completions.create(**_ocr_request(image_bytes))
+
     # Extract first text segment from the response. Adjust this if the
     # SDK response structure changes.
 
     return response.choices[0].message.content
 
 
+async def llm_ocr_async(image_bytes: bytes) -> str:
+    """Async variant of `llm_ocr`.
+
+    All calls made from the same event loop share one `AsyncOpenAI`
+    client. Callers are responsible for bounding concurrency.
+    """
+
+    client = _get_async_client()
+    response = await client.chat.completions.create(**_ocr_request(image_bytes))
+    return response.choices[0].message.content
+
+
+# Inputs per embeddings request.
+_EMBED_BATCH_SIZE = 100
+
+
+def embedding_model() -> str:
+    return os.getenv("EMBEDDING_MODEL") or "text-embedding-3-small"
+
+
+def embed_texts(texts: list[str], model: str | None = None) -> list[list[float]]:
+    """Embed `texts` in batches, returning one vector per input in order.
+
+    The model defaults to EMBEDDING_MODEL from the environment.
+    """
+
+    client = _client()
+    model = model or embedding_model()
+
+    vectors: list[list[float]] = []
+    for start in range(0, len(texts), _EMBED_BATCH_SIZE):
+        batch = texts[start : start + _EMBED_BATCH_SIZE]
+        response = client.embeddings.create(model=model, input=batch)
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda d: d.index))
+    return vectors
+
+
+def llm_ocr_batch(images: list[bytes]) -> list[str]:
+    """OCR several page images with a single vision request.
+
+    Returns one Markdown string per image, in order. If the response
+    cannot be split back into pages, each image is OCR'd on its own.
+    """
+
+    client = _client()
+    response = client.chat.completions.create(**_ocr_batch_request(images))
+    pages = _split_batch_response(response.choices[0].message.content, len(images))
+    if pages is None:
+        pages = [llm_ocr(image_bytes) for image_bytes in images]
+    return pages
+
+
+async def llm_ocr_batch_async(images: list[bytes]) -> list[str]:
+    """Async variant of `llm_ocr_batch`.
+
+    The per-page fallback runs one request at a time, so a batch never
+    has more than one request in flight under its caller's OCR slot.
+    """
+
+    client = _get_async_client()
+    response = await client.chat.completions.create(**_ocr_batch_request(images))
+    pages = _split_batch_response(response.choices[0].message.content, len(images))
+    if pages is None:
+        pages = [await llm_ocr_async(image_bytes) for image_bytes in images]
+    return pages
+
+
 if __name__ == "__main__":  # Manual test helper
     import sys
     from pathlib import Path
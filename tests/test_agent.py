@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+import agent
+from agent import CourseCorpus, check_coverage
+
+
+def _fake_embed_texts(texts: list[str], model: str | None = None) -> list[list[float]]:
+    # Vectors depend only on letter counts, so identical text embeds identically.
+    return [[float(t.count("a")) + 1.0, float(t.count("b")) + 1.0, 1.0] for t in texts]
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("MD_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(agent, "embed_texts", _fake_embed_texts)
+
+
+def test_check_coverage_skips_empty_documents():
+    corpus = CourseCorpus(
+        cheatsheet="aaa",
+        lecture_notes=["", "aaa", "   \n\n  "],
+        past_papers=["bbbbbb"],
+        assignments=[""],
+    )
+
+    report = check_coverage(corpus)
+
+    assert "- Lecture notes files: 3" in report
+    assert "## Lecture notes: similarity coverage" in report
+    assert "1 of 1 chunks" in report
+    assert "## Assignment questions" not in report
+
+
+def test_embed_document_caches_atomically(tmp_path):
+    chunks, emb = agent._embed_document("aaa\n\nbbb")
+
+    assert chunks == ["aaa\n\nbbb"]
+    files = list((tmp_path / "cache" / "embeddings").iterdir())
+    assert [f.suffix for f in files] == [".npy"]
+    np.testing.assert_allclose(np.load(files[0]), emb)
+
+
+def test_embed_document_cache_is_keyed_by_chunk_size(tmp_path, monkeypatch):
+    text = "aaaa\n\nbbbb\n\naaaa"
+    chunks, emb = agent._embed_document(text)
+    assert len(chunks) == len(emb) == 1
+
+    monkeypatch.setattr(agent, "_EMBED_CHUNK_CHARS", 4)
+    chunks, emb = agent._embed_document(text)
+
+    assert chunks == ["aaaa", "bbbb", "aaaa"]
+    assert len(emb) == 3
+    assert len(list((tmp_path / "cache" / "embeddings").iterdir())) == 2
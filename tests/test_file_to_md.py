@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import fitz
+import pytest
+
+import file_to_md
+from file_to_md import (
+    ConversionError,
+    _OrderedPageWriter,
+    _prepare_pdf,
+    _read_fingerprint,
+    is_generated_markdown,
+    produce_markdown,
+)
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("MD_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("OCR_BATCH_SIZE", "1")
+
+
+def _make_pdf(path, *page_texts):
+    with fitz.open() as doc:
+        for text in page_texts:
+            page = doc.new_page()
+            page.insert_text((72, 72), text)
+        doc.save(str(path))
+    return path
+
+
+class _FakeOcr:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, image_bytes: bytes) -> str:
+        self.calls += 1
+        return f"ocr text {self.calls}"
+
+
+def test_hand_written_sibling_is_never_overwritten(tmp_path):
+    pdf = _make_pdf(tmp_path / "notes.pdf", "Extracted lecture text " * 5)
+    md = tmp_path / "notes.md"
+    md.write_text("my own notes\n", encoding="utf-8")
+
+    assert produce_markdown(pdf) == (md, "my own notes\n")
+    assert produce_markdown(pdf, ocr_func=_FakeOcr(), use_ocr=True)[1] == "my own notes\n"
+    assert md.read_text(encoding="utf-8") == "my own notes\n"
+    assert not is_generated_markdown(md)
+
+
+def test_stale_sidecar_triggers_rebuild(tmp_path):
+    pdf = _make_pdf(tmp_path / "notes.pdf", "First version of the lecture " * 5)
+    _, first = produce_markdown(pdf)
+    assert "First version" in first
+
+    _make_pdf(pdf, "Second version of the lecture " * 5)
+    md_path, second = produce_markdown(pdf)
+
+    assert "Second version" in second
+    assert md_path.read_text(encoding="utf-8") == second
+    assert _read_fingerprint(md_path) == (file_to_md._fingerprint(pdf), "text")
+
+
+def test_cache_hit_restores_deleted_sibling(tmp_path):
+    pdf = _make_pdf(tmp_path / "notes.pdf", "Cached lecture text " * 5)
+    md_path, markdown = produce_markdown(pdf)
+    md_path.unlink()
+    file_to_md._fingerprint_path(md_path).unlink()
+
+    plan = _prepare_pdf(pdf, None)
+
+    assert plan.markdown == markdown
+    assert md_path.read_text(encoding="utf-8") == markdown
+    assert is_generated_markdown(md_path)
+
+
+def test_forced_route_mismatch_re_extracts(tmp_path):
+    pdf = _make_pdf(tmp_path / "notes.pdf", "Text layer " * 10, "More text " * 10)
+    _, text_markdown = produce_markdown(pdf)
+    assert "Text layer" in text_markdown
+
+    ocr = _FakeOcr()
+    md_path, ocr_markdown = produce_markdown(pdf, ocr_func=ocr, use_ocr=True)
+
+    assert ocr.calls == 2
+    assert ocr_markdown == "Page 1\n\nocr text 1\n\nPage 2\n\nocr text 2\n"
+    assert _read_fingerprint(md_path)[1] == "ocr"
+
+    # Auto mode accepts either route, so the OCR result is reused as-is.
+    assert produce_markdown(pdf)[1] == ocr_markdown
+    assert produce_markdown(pdf, ocr_func=ocr, use_ocr=True)[1] == ocr_markdown
+    assert ocr.calls == 2
+
+
+def test_failed_quality_check_writes_nothing(tmp_path):
+    pdf = _make_pdf(tmp_path / "notes.pdf", "Some lecture text " * 5)
+
+    with pytest.raises(ConversionError, match="quality check"):
+        produce_markdown(pdf, quality_checker=lambda text: False)
+
+    assert not (tmp_path / "notes.md").exists()
+    assert not any((tmp_path / "cache").glob("*.md"))
+
+
+def test_ordered_page_writer_orders_out_of_order_batches():
+    writer = _OrderedPageWriter()
+    writer.add_batch(range(2, 4), ["three", " "])
+    writer.add_batch(range(0, 2), ["one", "two"])
+
+    assert writer.getvalue(4) == "Page 1\n\none\n\nPage 2\n\ntwo\n\nPage 3\n\nthree\n"
+
+
+def test_ordered_page_writer_rejects_wrong_result_count():
+    writer = _OrderedPageWriter()
+
+    with pytest.raises(ConversionError, match="1 results for 2 pages"):
+        writer.add_batch(range(0, 2), ["only one"])
+    with pytest.raises(ConversionError, match="0 of 2 pages"):
+        writer.getvalue(2)
+
+
+def test_ordered_page_writer_rejects_missing_pages():
+    writer = _OrderedPageWriter()
+    writer.add_batch(range(1, 2), ["two"])
+
+    with pytest.raises(ConversionError, match="incomplete"):
+        writer.getvalue(2)
+
+
+def test_read_markdown_memo_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_to_md, "_MARKDOWN_MEMO_SIZE", 2)
+    monkeypatch.setattr(file_to_md, "_markdown_memo", file_to_md.OrderedDict())
+    paths = [tmp_path / f"{name}.md" for name in "abc"]
+    for path in paths:
+        path.write_text(path.stem, encoding="utf-8")
+        assert file_to_md.read_markdown(path) == path.stem
+
+    assert list(file_to_md._markdown_memo) == paths[1:]
+
+    file_to_md._write_markdown(paths[2], "rewritten")
+    assert list(file_to_md._markdown_memo) == paths[1:2]
+    assert file_to_md.read_markdown(paths[2]) == "rewritten"
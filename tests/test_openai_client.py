@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from openai_client import _split_batch_response
+
+
+def test_split_batch_response_in_order():
+    content = "<<<PAGE 1>>>\n# Intro\n\n- a\n<<<PAGE 2>>>\nSecond page\n<<<PAGE 3>>>\n"
+
+    assert _split_batch_response(content, 3) == ["# Intro\n\n- a", "Second page", ""]
+
+
+def test_split_batch_response_rejects_missing_or_reordered_markers():
+    assert _split_batch_response("<<<PAGE 1>>>\none\n<<<PAGE 3>>>\nthree", 3) is None
+    assert _split_batch_response("<<<PAGE 2>>>\ntwo\n<<<PAGE 1>>>\none", 2) is None
+    assert _split_batch_response("<<<PAGE 1>>>\none\n<<<PAGE 2>>>\ntwo", 1) is None
+    assert _split_batch_response("no markers at all", 1) is None
+    assert _split_batch_response(None, 1) is None
+
+
+def test_split_batch_response_drops_text_before_first_marker():
+    content = "Here are the pages:\n<<<PAGE 1>>>\none\n  <<<PAGE 2>>>  \ntwo"
+
+    assert _split_batch_response(content, 2) == ["one", "two"]
+
+
+def test_split_batch_response_ignores_inline_markers():
+    # Markers only count on a line of their own.
+    content = "<<<PAGE 1>>>\nsee <<<PAGE 2>>> below\n<<<PAGE 2>>>\ntwo"
+
+    assert _split_batch_response(content, 2) == ["see <<<PAGE 2>>> below", "two"]